@@ -1,5 +1,7 @@
 import logging
 import abc
+import time
+from os import makedirs
 from threading import Lock
 from ...utils.scheduler import Job
 
@@ -17,12 +19,16 @@ class Source(metaclass=abc.ABCMeta):
         """
         self.tmp_dir = tmpdir
         """The temporary directory path. Where the downloaded intermediate files are located."""
+        # Created once here, so the per-batch subdirectories only need a single mkdir
+        makedirs(tmpdir, exist_ok=True)
         self.bin_dir = bindir
         """The binary directory path. Where the helper binaries tools are stored."""
         self.logger = logger
         """The logger object for logging messages."""
         self.mutex = Lock()
         """A lock object for thread synchronization."""
+        self.rate_lock = Lock()
+        """A lock protecting the delay check-and-set window. Never held during a query."""
         self.last_query = 0
         """The timestamp of the last query."""
         self.min_delay = min_delay
@@ -37,12 +43,22 @@ class Source(metaclass=abc.ABCMeta):
         """
         pass
 
-    @abc.abstractmethod
     def src_delay_ready(self) -> bool:
         """
-        :return: True if the minimum delay has passed between queries, False otherwise.
+        Checks if the minimum delay between queries to this source has passed and
+        reserves the next query slot when it has.
+        The dedicated rate lock is held only for the check-and-set window, so
+        concurrent callers are delayed by the check itself instead of being
+        rejected while a query is in flight under the source mutex.
+
+        :return: True if the minimum delay has passed, False otherwise.
         """
-        pass
+        with self.rate_lock:
+            now = time.monotonic()
+            ready = now - self.last_query > self.min_delay
+            if ready:
+                self.last_query = now
+        return ready
 
     @abc.abstractmethod
     def jobs_from_accessions(self, accessions: list[str], datadir: str) -> list[Job]:
@@ -50,22 +50,6 @@ class ENA(Source):
         return True
 
 
-    def src_delay_ready(self) -> bool :
-        """
-        Checks if the minimum delay between ENA queries has passed.
-
-        :returns: True if the minimum delay has passed, False otherwise.
-        """
-        # Minimal delay between SRA queries (0.5s)
-        locked = self.mutex.acquire(blocking=False)
-        ready = False
-        if locked:
-            ready = time.time() - self.last_query > self.min_delay
-            if ready:
-                self.last_query = time.time()
-            self.mutex.release()
-        return ready
-    
     def wait_my_turn(self) -> None:
         """
         Waits for the minimum delay between ENA queries.
@@ -276,7 +260,7 @@ class ENA(Source):
                 self.logger.error(f'Error querying ENA\nQuery: {query}\nAnswer: {response.stderr.decode()}')
                 continue
             # Update the last query time
-            self.last_query = time.time()
+            self.last_query = time.monotonic()
             self.mutex.release()
 
             # Parse the response
@@ -322,7 +306,7 @@ class ENA(Source):
         self.wait_my_turn()
         response = subprocess.run(['curl', query], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         # Update the last query time
-        self.last_query = time.time()
+        self.last_query = time.monotonic()
         self.mutex.release()
         # Check if the query was successful
         if response.returncode != 0:
@@ -343,7 +327,7 @@ class ENA(Source):
         response = subprocess.run(['curl', submitted_url], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
         # Update the last query time
-        self.last_query = time.time()
+        self.last_query = time.monotonic()
         self.mutex.release()
         # Check if the query was successful
         if response.returncode != 0:
@@ -1,15 +1,19 @@
 import logging
 import platform
+import re
+import sys
 import time
 import json
 import subprocess
 import threading
-from os import listdir, makedirs, path
-from shutil import rmtree, move
+from zipfile import BadZipFile, ZipFile
+from concurrent.futures import ThreadPoolExecutor
+from os import chmod, environ, listdir, makedirs, mkdir, path, replace, scandir
 
 from . import Source
-from ...utils.scheduler import Job, CmdLineJob, FunctionJob
-from ...utils.download import check_binary
+from ...utils.scheduler import Job, FunctionJob
+from ...utils.download import (background_rmtree, check_binary, fast_move, load_cached_binaries,
+                               same_filesystem, save_cached_binaries, stream_download)
 
 # GCA_003774525.2 GCA_015190445.1 GCA_01519
 
@@ -27,6 +31,16 @@ class NCBI(Source):
 
     ncbi_joib_id = 0
 
+    accession_field_pattern = re.compile(rb'"accession"\s*:\s*"([^"]+)"')
+    """Pattern of the accession field of a json report line."""
+
+    validation_cache_file = path.join(path.expanduser('~'), '.cache', 'seqdd', 'ncbi_valid.json')
+    """Path of the file caching the accessions validated by previous runs."""
+
+    validation_cache_ttl = 30 * 24 * 3600
+    """Lifetime of a cached validation in seconds. Valid accessions very rarely disappear,
+    the TTL only guards against retracted assemblies."""
+
 
     def __init__(self, tmpdir: str, bindir: str, logger: logging.Logger) -> None:
         """
@@ -36,8 +50,14 @@ class NCBI(Source):
         :param bindir: The binary directory path.
         :param logger: The logger object for logging messages.
         """
-        super().__init__(tmpdir, bindir, logger)
-
+        # The NCBI allows 10 queries per second with an API key, at least 3 without
+        api_key = environ.get('NCBI_API_KEY')
+        super().__init__(tmpdir, bindir, logger, min_delay=0.1 if api_key else 0.34)
+
+        self.api_key = api_key
+        """The NCBI API key, read from the NCBI_API_KEY environment variable."""
+        self.key_option = f' --api-key {api_key}' if api_key else ''
+        """The API key option to inject in the datasets cli commands."""
         self.bin = self.get_download_software()
         """The path to the NCBI download software."""
 
@@ -51,25 +71,6 @@ class NCBI(Source):
         return self.bin is not None
 
 
-    def src_delay_ready(self) -> bool:
-        """
-        Checks if the minimum delay between NCBI queries has passed.
-
-        :return: True if the delay has passed, False otherwise.
-        """
-        # Minimal delay between ncbi queries (1s)
-        min_delay = 1
-        locked = self.mutex.acquire(blocking=False)
-        ready = False
-        if locked:
-            # 5s since the last query ?
-            ready = time.time() - self.last_query > min_delay
-            if ready:
-                self.last_query = time.time()
-            self.mutex.release()
-        return ready
-
-
     def wait_ncbi_delay(self) -> threading.Lock:
         """
         Wait for the NCBI ressource to be available (some delay between queries must be waited).
@@ -78,7 +79,7 @@ class NCBI(Source):
         :return: The NCBI query lock.
         """
         while not self.src_delay_ready():
-            time.sleep(time.time() - self.last_query)
+            time.sleep(max(self.min_delay - (time.monotonic() - self.last_query), 0.01))
 
         self.mutex.acquire()
         return self.mutex
@@ -93,13 +94,26 @@ class NCBI(Source):
         :return: A list of jobs for downloading and processing accessions.
         """
         accessions = list(accessions)
+
+        # Do not download the datasets already present in the destination directory
+        downloaded_accessions = frozenset(listdir(dest_dir)) if path.isdir(dest_dir) else frozenset()
+        to_download = [acc for acc in accessions if acc not in downloaded_accessions]
+        if len(to_download) < len(accessions):
+            self.logger.info(f'{len(accessions) - len(to_download)} NCBI datasets already downloaded. Skipping...')
+        accessions = to_download
+
         all_jobs = []
 
         # Download accessions by batch of 5
         for idx in range(0, len(accessions), 5):
-            # Create a temporary directory for the current job
+            # Create a temporary directory for the current job. The parent directory exists
+            # since __init__, so a single mkdir replaces the path walk of makedirs.
             tmp_dir = path.join(self.tmp_dir, f'ncbi_{NCBI.ncbi_joib_id}')
-            makedirs(tmp_dir, exist_ok=True)
+            try:
+                mkdir(tmp_dir)
+            except FileExistsError:
+                # Leftover from a previous interrupted run
+                pass
             # Job name
             job_name = f'ncbi_job_{NCBI.ncbi_joib_id}'
             NCBI.ncbi_joib_id += 1
@@ -107,36 +121,55 @@ class NCBI(Source):
             # Take the right slice of 5 accessions
             acc_slice = accessions[idx:idx+5]
 
-            # Download dehydrated job
+            # Download dehydrated, extract and rehydrate in a single job. Fusing the three
+            # steps halves the process creations and the scheduler transitions per batch,
+            # and the archive is extracted in-process instead of spawning unzip.
             download_file = path.join(tmp_dir, f'{job_name}.zip')
-            download_job = CmdLineJob(f"{self.bin} download genome accession --dehydrated --no-progressbar "
-                                      f"--filename {download_file} {' '.join(acc_slice)}",
-                                      can_start=self.src_delay_ready,
-                                      name=f'{job_name}_download')
-            
-            # Unzip Job
             unzip_dir = path.join(tmp_dir, job_name)
-            unzip_job = CmdLineJob(f"unzip -n {download_file} -d {unzip_dir}",
-                                   parents=[download_job],
-                                   name=f'{job_name}_unzip')
-
-            # Data download
-            rehydrate_job = CmdLineJob(f"{self.bin} rehydrate --gzip --no-progressbar --directory {unzip_dir}",
-                                       parents=[unzip_job],
+            download_job = FunctionJob(self.download_and_rehydrate,
+                                       func_args=(acc_slice, download_file, unzip_dir),
                                        can_start=self.src_delay_ready,
-                                       name=f'{job_name}_rehydrate')
+                                       name=f'{job_name}_download')
 
             # Data reorganization
             reorg_job = FunctionJob(self.clean,
                                     func_args=(unzip_dir, dest_dir, tmp_dir),
-                                    parents=[rehydrate_job],
+                                    parents=[download_job],
                                     name=f'{job_name}_clean')
 
-            all_jobs.extend([download_job, unzip_job, rehydrate_job, reorg_job])
+            all_jobs.extend([download_job, reorg_job])
 
         return all_jobs
 
 
+    def download_and_rehydrate(self, acc_slice: list[str], download_file: str, unzip_dir: str) -> None:
+        """
+        Downloads the dehydrated archive of a slice of accessions, extracts it and
+        rehydrates it. The archive is extracted with zipfile rather than an unzip
+        subprocess. Runs inside a FunctionJob, so its outputs go to the job log.
+
+        :param acc_slice: The slice of accessions to download.
+        :param download_file: The path of the dehydrated archive to download.
+        :param unzip_dir: The directory path where the archive is extracted.
+        """
+        # Download the dehydrated archive
+        cmd = (f'{self.bin} download genome accession{self.key_option} --dehydrated --no-progressbar '
+               f'--filename {download_file} {" ".join(acc_slice)}')
+        ret = subprocess.run(cmd.split(), stdout=sys.stdout, stderr=sys.stderr)
+        if ret.returncode != 0:
+            raise Exception(f'Failed to download the accessions: {", ".join(acc_slice)}')
+
+        # Extract the archive in-process
+        with ZipFile(download_file) as archive:
+            archive.extractall(unzip_dir)
+
+        # Download the actual sequence data
+        cmd = f'{self.bin} rehydrate{self.key_option} --gzip --no-progressbar --directory {unzip_dir}'
+        ret = subprocess.run(cmd.split(), stdout=sys.stdout, stderr=sys.stderr)
+        if ret.returncode != 0:
+            raise Exception(f'Failed to rehydrate {unzip_dir}')
+
+
     def clean(self, unzip_dir: str, dest_dir: str, tmp_dir: str) -> None:
         """
         Cleans up the downloaded files and moves them to the destination directory.
@@ -148,16 +181,21 @@ class NCBI(Source):
         # Remove subdirectories while moving their content
         data_dir = path.join(unzip_dir, "ncbi_dataset", "data")
 
-        # Enumerated the downloaded files
-        for subname in listdir(data_dir):
-            subpath = path.join(data_dir, subname)
-            # Looks only for datasets
-            if path.isdir(subpath):
-                # Move the directory and its content to the final directory
-                move(subpath, path.join(dest_dir, subname))
+        # Datasets directories can be renamed instead of copied when the tmp and destination
+        # directories share a filesystem. Checked once for the whole batch.
+        same_fs = same_filesystem(data_dir, dest_dir)
+
+        # Enumerated the downloaded files. scandir reuses the file types returned by the
+        # directory listing instead of one stat call per entry.
+        with scandir(data_dir) as entries:
+            for entry in entries:
+                # Looks only for datasets
+                if entry.is_dir(follow_symlinks=False):
+                    # Move the directory and its content to the final directory
+                    fast_move(entry.path, path.join(dest_dir, entry.name), same_fs)
 
-        # Clean the download directory
-        rmtree(tmp_dir)
+        # Clean the download directory without blocking on the removal
+        background_rmtree(tmp_dir)
 
 
     @staticmethod
@@ -200,42 +238,178 @@ class NCBI(Source):
             self.logger.warning(f'Wrong format accessions: {", ".join(invalid_accessions)}. '
                                 f'Expectiing GCA_XXXXXXXXX.Y or GCF_XXXXXXXXX.Y')
 
+        # Skip the accessions already validated by a previous run
+        validation_cache = self.load_validation_cache()
+        now = time.time()
+        cached_valid = {acc for acc in accessions_list
+                        if now - validation_cache.get(acc, -float('inf')) < NCBI.validation_cache_ttl}
+        to_validate = [acc for acc in accessions_list if acc not in cached_valid]
+
+        new_valid = set()
+        if len(to_validate) > 0:
+            # Validate all the accessions with a single dehydrated download (one query to NCBI)
+            new_valid = self.validate_accessions_batch(to_validate)
+            if new_valid is None:
+                # The batch query failed. Fall back to sliced summary queries.
+                new_valid = self.validate_accessions_by_slices(to_validate)
+
+            # Remember the newly validated accessions for the next runs
+            validation_cache.update({acc: now for acc in new_valid})
+            self.save_validation_cache(validation_cache)
+
+        valid_accessions = cached_valid | new_valid
+
+        unknown_accessions = set(accessions_list) - valid_accessions
+        if len(unknown_accessions) > 0:
+            self.logger.warning(f'Unknown accessions: {", ".join(unknown_accessions)}')
+
+        return valid_accessions
+
+
+    def load_validation_cache(self) -> dict[str, float]:
+        """
+        Loads the accession validation cache shared between runs.
+
+        :return: A dictionary mapping each validated accession to its validation timestamp.
+        """
+        try:
+            with open(NCBI.validation_cache_file) as fr:
+                return json.load(fr)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+
+    def save_validation_cache(self, validation_cache: dict[str, float]) -> None:
+        """
+        Saves the accession validation cache, dropping the expired entries.
+
+        :param validation_cache: A dictionary mapping each validated accession to its
+                                 validation timestamp.
+        """
+        now = time.time()
+        validation_cache = {acc: ts for acc, ts in validation_cache.items()
+                            if now - ts < NCBI.validation_cache_ttl}
+        try:
+            makedirs(path.dirname(NCBI.validation_cache_file), exist_ok=True)
+            with open(NCBI.validation_cache_file, 'w') as fw:
+                json.dump(validation_cache, fw)
+        except OSError:
+            self.logger.warning(f'Cannot write the validation cache at {NCBI.validation_cache_file}')
+
+
+    def validate_accessions_batch(self, accessions_list: list[str]) -> set[str]|None:
+        """
+        Validates all the accessions at once by downloading a dehydrated archive with no data
+        (--include none) and parsing the assembly data report from it.
+        A single query to the NCBI is performed whatever the number of accessions.
+
+        :param accessions_list: The list of well formatted accessions to validate.
+        :return: The set of valid accessions, or None if the batch query failed.
+        """
+        if len(accessions_list) == 0:
+            return set()
+
+        # Prepare a working directory with the accession list
+        tmp_dir = path.join(self.tmp_dir, 'ncbi_check')
+        makedirs(tmp_dir, exist_ok=True)
+        acc_file = path.join(tmp_dir, 'acc.txt')
+        with open(acc_file, 'w') as fw:
+            print('\n'.join(accessions_list), file=fw)
+
+        archive = path.join(tmp_dir, 'ncbi_check.zip')
+        cmd = (f'{self.bin} download genome accession{self.key_option} --inputfile {acc_file} '
+               f'--include none --no-progressbar --filename {archive}')
+        lock = self.wait_ncbi_delay()
+        ret = subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        lock.release()
+
+        if ret.returncode != 0:
+            self.logger.warning('Batched NCBI accession validation failed. Falling back to sliced queries.')
+            background_rmtree(tmp_dir)
+            return None
+
+        # Stream the assembly data report directly from the archive, without extracting it.
+        # Each line is a json object describing one accession but only the accession field
+        # is needed: extract it with a regex instead of parsing the whole json object.
         valid_accessions = set()
-        unknown_accessions = set()
+        valid_accession_set = set(accessions_list)
+        try:
+            with ZipFile(archive) as zf, zf.open('ncbi_dataset/data/assembly_data_report.jsonl') as fr:
+                for line in fr:
+                    match = NCBI.accession_field_pattern.search(line)
+                    if match:
+                        acc = match.group(1).decode()
+                    else:
+                        # Unexpected field layout: fall back to a full json parsing of the line
+                        try:
+                            acc = json.loads(line)['accession']
+                        except (json.JSONDecodeError, KeyError):
+                            continue
+                    if acc in valid_accession_set:
+                        valid_accessions.add(acc)
+        except (BadZipFile, KeyError):
+            self.logger.warning('Unreadable NCBI validation archive. Falling back to sliced queries.')
+            background_rmtree(tmp_dir)
+            return None
+
+        background_rmtree(tmp_dir)
+        return valid_accessions
+
+
+    def validate_accessions_by_slices(self, accessions_list: list[str]) -> set[str]:
+        """
+        Validates the accessions by querying the NCBI summaries by slices.
+        The slices are queried concurrently by a thread pool: validation is I/O bound,
+        so the threads hide the network latency across slices while src_delay_ready
+        keeps the query starts under the NCBI rate limit.
+
+        :param accessions_list: The list of well formatted accessions to validate.
+        :return: The set of valid accessions.
+        """
         accessions_per_query = 32
+        slices = [accessions_list[idx:idx+accessions_per_query]
+                  for idx in range(0, len(accessions_list), accessions_per_query)]
+
+        valid_accessions = set()
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            for slice_valid in executor.map(self.validate_accessions_slice, slices):
+                valid_accessions.update(slice_valid)
 
-        for idx in range(0, len(accessions), accessions_per_query):
-            slice = accessions_list[idx:idx+accessions_per_query]
+        return valid_accessions
 
-            # Query the NCBI to check if the accessions are valid
-            cmd = f'{self.bin} summary genome accession {" ".join(slice)}'
-            lock = self.wait_ncbi_delay()
-            ret = subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            lock.release()
 
-            if ret.returncode != 0:
-                self.logger.error(f'Failed to query NCBI for accessions: {", ".join(slice)}')
-                continue
+    def validate_accessions_slice(self, slice: list[str]) -> set[str]:
+        """
+        Validates one slice of accessions with a single NCBI summary query.
+        The query start is delayed until the rate limiter allows it.
 
-            # parse the json from the stout of the subprocess
-            slice_set = set(slice)
-            try:
-                data = json.loads(ret.stdout)
-                if 'reports' in data:
-                    # Update accessions returned
-                    for acc_obj in data['reports']:
-                        acc = acc_obj['accession']
-                        if acc in slice_set:
-                            valid_accessions.add(acc)
-                            slice_set.remove(acc)
-
-                # Update unknown accessions
-                unknown_accessions.update(slice_set)
-            except json.JSONDecodeError:
-                self.logger.error(f'Failed to parse the json response from NCBI for accessions: {", ".join(slice)}')
+        :param slice: The slice of accessions to validate.
+        :return: The set of valid accessions from the slice.
+        """
+        # Query the NCBI to check if the accessions are valid
+        cmd = f'{self.bin} summary genome accession{self.key_option} {" ".join(slice)}'
+        while not self.src_delay_ready():
+            time.sleep(0.01)
+        ret = subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        if len(unknown_accessions) > 0:
-            self.logger.warning(f'Unknown accessions: {", ".join(unknown_accessions)}')
+        if ret.returncode != 0:
+            self.logger.error(f'Failed to query NCBI for accessions: {", ".join(slice)}')
+            return set()
+
+        # parse the json from the stout of the subprocess
+        valid_accessions = set()
+        slice_set = set(slice)
+        try:
+            data = json.loads(ret.stdout)
+            if 'reports' in data:
+                # Update accessions returned
+                for acc_obj in data['reports']:
+                    acc = acc_obj['accession']
+                    if acc in slice_set:
+                        valid_accessions.add(acc)
+                        slice_set.remove(acc)
+        except json.JSONDecodeError:
+            self.logger.error(f'Failed to parse the json response from NCBI for accessions: {", ".join(slice)}')
 
         return valid_accessions
     
@@ -246,19 +420,28 @@ class NCBI(Source):
 
         :return: The path to the NCBI download software, or None if it is not installed.
         """
+        # Path already resolved by a previous run ?
+        cached = load_cached_binaries(self.bin_dir, naming['key'])
+        if cached is not None:
+            return cached['datasets']
+
         # Check if the system has the ncbi datasets cli
         system_installed = check_binary('datasets')
         if system_installed:
-            return 'datasets'
-        
-        # Check if the software is locally installed
-        local_bin = path.abspath(path.join(self.bin_dir, 'datasets'))
-        locally_installed = check_binary(local_bin)
-        if locally_installed:
-            return f'{local_bin}'
-        
-        # Install the software
-        return self.install_datasets_software()
+            binpath = 'datasets'
+        else:
+            # Check if the software is locally installed
+            local_bin = path.abspath(path.join(self.bin_dir, 'datasets'))
+            locally_installed = check_binary(local_bin)
+            if locally_installed:
+                binpath = f'{local_bin}'
+            else:
+                # Install the software
+                binpath = self.install_datasets_software()
+
+        if binpath is not None:
+            save_cached_binaries(self.bin_dir, naming['key'], {'datasets': binpath})
+        return binpath
 
 
     def install_datasets_software(self) -> str|None:
@@ -297,24 +480,27 @@ class NCBI(Source):
         download_dir = path.abspath(self.bin_dir)
         makedirs(download_dir, exist_ok=True)
         
-        # Download...
-        cmd = f'curl -o {path.join(download_dir, "datasets")} {download_link}'
-        ret = subprocess.run(cmd.split(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        if ret.returncode == 0:
-            binpath = path.join(download_dir, 'datasets')
+        # Download... The binary is streamed to disk in-process and its checksum can be
+        # pinned through the SEQDD_DATASETS_SHA256 environment variable.
+        binpath = path.join(download_dir, 'datasets')
+        downloaded = stream_download(download_link, binpath, self.logger,
+                                     expected_sha256=environ.get('SEQDD_DATASETS_SHA256'))
 
-            ret = subprocess.run(f'chmod +x {binpath}'.split())
-            if ret.returncode == 0:
-                # move the binary to the bin directory
-                final_path = path.abspath(path.join(self.bin_dir, 'datasets'))
-                move(binpath, final_path)
-                self.logger.info(f'ncbi datasets cli installed at {final_path}')
+        if downloaded:
+            final_path = path.abspath(path.join(self.bin_dir, 'datasets'))
 
-                return f'{final_path}'
-            else:
-                # Failed to set executable permissions
-                self.logger.error(f'Failed to set executable permissions for ncbi datasets cli: {binpath}')
+            try:
+                # Set the executable permissions and move the binary into place.
+                # Both are in-process syscalls and the rename is atomic.
+                chmod(binpath, 0o755)
+                replace(binpath, final_path)
+            except OSError:
+                # Failed to set executable permissions or to move the binary
+                self.logger.error(f'Failed to install the ncbi datasets cli at {final_path}')
+                return None
+
+            self.logger.info(f'ncbi datasets cli installed at {final_path}')
+            return f'{final_path}'
         else:
             # Failed to download ncbi datasets cli
             self.logger.error(f'Failed to download ncbi datasets cli from: {download_link}')
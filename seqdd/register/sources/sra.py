@@ -1,12 +1,13 @@
 import logging
 import platform
 import subprocess
-import time
-from os import listdir, makedirs, path, remove
+import tarfile
+from os import cpu_count, environ, makedirs, mkdir, path, remove, rename, scandir, symlink
 from shutil import rmtree, move
 
 from . import Source
-from ...utils.download import check_binary
+from ...utils.download import (background_rmtree, check_binary, fast_move, load_cached_binaries,
+                               same_filesystem, save_cached_binaries, stream_download)
 from ...utils.scheduler import Job, CmdLineJob, FunctionJob
 
 
@@ -35,32 +36,30 @@ class SRA(Source):
 
         self.binaries = self.download_sra_toolkit()
         """A dictionary containing the paths to the SRA toolkit binaries."""
+        self.compressor = self.get_compression_software()
+        """The command used to compress the fastq files."""
 
 
-    def is_ready(self) -> bool:
+    def get_compression_software(self) -> str:
         """
-        Checks if the SRA toolkit binaries are ready for use.
+        Selects the software used to compress the fastq files.
+        pigz compresses with one thread per core; gzip is the single-threaded fallback
+        when pigz is not installed.
 
-        :return: True if the binaries are ready, False otherwise.
+        :return: The compression command.
         """
-        return self.binaries is not None
+        if check_binary('pigz'):
+            return f'pigz -p {cpu_count()}'
+        return 'gzip'
 
 
-    def src_delay_ready(self) -> bool:
+    def is_ready(self) -> bool:
         """
-        Checks if the minimum delay between SRA queries has passed.
+        Checks if the SRA toolkit binaries are ready for use.
 
-        :return: True if the minimum delay has passed, False otherwise.
+        :return: True if the binaries are ready, False otherwise.
         """
-        # Minimal delay between SRA queries (0.5s)
-        locked = self.mutex.acquire(blocking=False)
-        ready = False
-        if locked:
-            ready = time.time() - self.last_query > self.min_delay
-            if ready:
-                self.last_sra_query = time.time()
-            self.mutex.release()
-        return ready
+        return self.binaries is not None
 
 
     def filter_valid_accessions(self, accessions: list[str]) -> list[str]:
@@ -84,37 +83,52 @@ class SRA(Source):
         """
         jobs = []
 
-        # Each dataset download is independent
+        # Filter out the already downloaded datasets and prepare a tmp directory per accession
+        to_download = []
         for acc in accessions:
             # Do not download an already downloaded dataset
             if path.exists(path.join(datadir, acc)):
                 self.logger.info(f'{acc} already downloaded. Skipping...')
                 continue
+            to_download.append(acc)
 
-            # Create a job name based on the accession
-            job_name = f'sra_{acc}'
-            
-            # Create a tmp directory for the accession. Remove the previous one if it exists
+            # Create a tmp directory for the accession. Remove the previous one if it exists.
+            # The parent directory exists since __init__, so a single mkdir is enough.
             acc_dir = path.join(self.tmp_dir, acc)
             if path.exists(acc_dir):
                 rmtree(acc_dir)
-            makedirs(acc_dir)
-
+            mkdir(acc_dir)
+
+        # Prefetch SRR accessions by batches of 8. prefetch accepts several accessions
+        # per call, which amortizes its startup cost over the batch.
+        srr_accessions = [acc for acc in to_download if acc.startswith('SRR')]
+        prefetch_by_acc = {}
+        for idx in range(0, len(srr_accessions), 8):
+            batch = srr_accessions[idx:idx+8]
+            cmd = f'{self.binaries["prefetch"]} --max-size u --output-directory {self.tmp_dir} {" ".join(batch)}'
+            batch_job = CmdLineJob(cmd, can_start=self.src_delay_ready, name=f'sra_prefetch_batch_{idx//8}')
+            jobs.append(batch_job)
+            prefetch_by_acc.update({acc: batch_job for acc in batch})
+
+        # Each dataset processing is independent
+        for acc in to_download:
+            # Create a job name based on the accession
+            job_name = f'sra_{acc}'
+            acc_dir = path.join(self.tmp_dir, acc)
 
             # Fasterq-dump
-            prefetch_job = None
-            fasterq_dump_jobs = []
             if acc.startswith('SRR'):
-                # Prefetch data
-                cmd = f'{self.binaries["prefetch"]} --max-size u --output-directory {self.tmp_dir} {acc}'
-                prefetch_job = CmdLineJob(cmd, can_start=self.src_delay_ready, name=f'{job_name}_prefetch')
-                # Download SRR accession
+                # Prefetched by batch
+                prefetch_job = prefetch_by_acc[acc]
                 fasterq_dump_jobs = self.jobs_from_SRR(acc_dir, job_name)
             elif acc.startswith('SRX') or acc.startswith('SRP'):
-                # Prefetch data
+                # Prefetch data. One job per accession as the output directories differ.
                 cmd = f'{self.binaries["prefetch"]} --max-size u --output-directory {acc_dir} {acc}'
                 prefetch_job = CmdLineJob(cmd, can_start=self.src_delay_ready, name=f'{job_name}_prefetch')
+                jobs.append(prefetch_job)
                 fasterq_dump_jobs = self.jobs_from_SRXP(acc_dir, job_name)
+            else:
+                continue
 
             # define parents
             for job in fasterq_dump_jobs:
@@ -127,7 +141,6 @@ class SRA(Source):
                                     name=f'{job_name}_clean')
 
             # Set the jobs
-            jobs.append(prefetch_job)
             jobs.extend(fasterq_dump_jobs)
             jobs.append(clean_job)
 
@@ -143,18 +156,37 @@ class SRA(Source):
         """
         # Get the accession name
         accession = path.basename(accession_dir)
+        parent_outdir = outdir
         outdir = path.join(outdir, accession)
-        makedirs(outdir, exist_ok=True)
 
-        # Enumerate all the files from the accession directory
-        for node in listdir(accession_dir):
-            nodepath = path.join(accession_dir, node)
+        # Files can be renamed instead of copied when the tmp and output directories share
+        # a filesystem. Checked once for the whole accession.
+        same_fs = same_filesystem(accession_dir, parent_outdir)
+
+        # Enumerate all the files from the accession directory. scandir avoids one stat
+        # call per entry by reusing the file types from the directory listing.
+        with scandir(accession_dir) as entries:
+            content = [(entry.name, entry.is_file() and entry.name.endswith('.gz'))
+                       for entry in entries]
+
+        # When the directory holds nothing but the expected files, one rename of the whole
+        # directory replaces one rename per file plus the rmtree of the leftovers.
+        if same_fs and not path.exists(outdir) and all(keep for _, keep in content):
+            try:
+                rename(accession_dir, outdir)
+                return
+            except OSError:
+                # Unexpected rename failure: go through the per-file moves
+                pass
+
+        makedirs(outdir, exist_ok=True)
+        for name, keep in content:
             # Move SRR accession files
-            if path.isfile(nodepath) and node.endswith('.gz'):
-                move(path.join(accession_dir, node), path.join(outdir, node))
+            if keep:
+                fast_move(path.join(accession_dir, name), path.join(outdir, name), same_fs)
 
-        # Clean the directory
-        rmtree(accession_dir)
+        # Clean the directory without blocking on the removal
+        background_rmtree(accession_dir)
 
 
     # ---- SRA specific jobs ----
@@ -171,7 +203,7 @@ class SRA(Source):
         fasterqdump_job = CmdLineJob(cmd, can_start=self.src_delay_ready, name=f'{job_name}_fasterqdump')
         
         # Compress files
-        cmd = f'gzip {path.join(accession_dir, "*.fastq")}'
+        cmd = f'{self.compressor} {path.join(accession_dir, "*.fastq")}'
         compress_job = CmdLineJob(cmd, parents=[fasterqdump_job], name=f'{job_name}_compress')
 
         return [fasterqdump_job, compress_job]
@@ -201,11 +233,13 @@ class SRA(Source):
         # TODO: Move log files to the log directory. Can be done after yielding.
         SRX_name = path.basename(SRXP_directory)
 
-        for subdirectory_name in listdir(SRXP_directory):
+        # Materialize the run subdirectories first as the loop body modifies the directory
+        with scandir(SRXP_directory) as entries:
+            run_directories = [entry.name for entry in entries
+                               if entry.is_dir(follow_symlinks=False) and entry.name.startswith('SRR')]
+
+        for subdirectory_name in run_directories:
             subdirectory = path.join(SRXP_directory, subdirectory_name)
-            # Verify that is a run subdirectory
-            if (not path.isdir(subdirectory)) or (not subdirectory_name.startswith('SRR')):
-                continue
             
             res = None
             log_file = path.join(self.tmp_dir, f'{SRX_name}_{subdirectory_name}_fasterq-dump.log')
@@ -224,23 +258,27 @@ class SRA(Source):
             fp.close()
 
 
-            # Compress fastq files
-            for filename in listdir(subdirectory):
-                if not filename.endswith('.fastq'):
-                    continue
-                cmd = f'gzip {path.join(subdirectory, filename)}'
+            # Materialize the fastq files first as the loop body modifies the directory
+            with scandir(subdirectory) as entries:
+                fastq_files = [entry.name for entry in entries
+                               if entry.is_file() and entry.name.endswith('.fastq')]
+
+            # Compress all the fastq files with a single invocation
+            if len(fastq_files) > 0:
+                cmd = f'{self.compressor} {" ".join(path.join(subdirectory, f) for f in fastq_files)}'
                 with open(log_file, 'a') as log:
                     res = subprocess.run(cmd.split(), stdout=log, stderr=log)
                 if res.returncode != 0:
                     self.logger.error(f'Error while compressing fastq files in {subdirectory}')
                     raise Exception(f'Error while compressing fastq files in {subdirectory}')
-            
-                gzip_filename = f'{filename}.gz'
+
                 # Move the compressed files to the SRXP directory
-                move(path.join(subdirectory, gzip_filename), path.join(SRXP_directory, gzip_filename))
+                for filename in fastq_files:
+                    gzip_filename = f'{filename}.gz'
+                    move(path.join(subdirectory, gzip_filename), path.join(SRXP_directory, gzip_filename))
 
-            # Remove the subdirectory
-            rmtree(subdirectory)
+            # Remove the subdirectory without blocking on the removal
+            background_rmtree(subdirectory)
     
 
     # ---- Toolkit preparation ----
@@ -251,29 +289,39 @@ class SRA(Source):
 
         :return: A dictionary containing the paths to the SRA toolkit binaries.
         """
-        # Check if the system has the ncbi datasets cli
+        # Paths already resolved by a previous run ?
+        cached = load_cached_binaries(self.bin_dir, naming['key'])
+        if cached is not None:
+            return cached
+
+        binaries = None
+        # Check if the system has the sra toolkit
         prefetch_installed = check_binary('prefetch')
         fasterqdump_installed = check_binary('fasterq-dump')
         if prefetch_installed and fasterqdump_installed:
-            return {
+            binaries = {
                 'prefetch': 'prefetch',
                 'fasterq-dump': 'fasterq-dump'
             }
-        
-        # Check if the software is locally installed
-        prefetch_local_bin = path.abspath(path.join(self.bin_dir, 'prefetch'))
-        fasterqdump_local_bin = path.abspath(path.join(self.bin_dir, 'fasterq-dump'))
-        prefetch_installed = check_binary(prefetch_local_bin)
-        fasterqdump_installed = check_binary(fasterqdump_local_bin)
-        
-        if prefetch_installed and fasterqdump_installed:
-            return {
-                'prefetch': f'{prefetch_local_bin}',
-                'fasterq-dump': f'{fasterqdump_local_bin}'
-            }
-        
-        # Install the software
-        return self.install_sratoolkit()
+        else:
+            # Check if the software is locally installed
+            prefetch_local_bin = path.abspath(path.join(self.bin_dir, 'prefetch'))
+            fasterqdump_local_bin = path.abspath(path.join(self.bin_dir, 'fasterq-dump'))
+            prefetch_installed = check_binary(prefetch_local_bin)
+            fasterqdump_installed = check_binary(fasterqdump_local_bin)
+
+            if prefetch_installed and fasterqdump_installed:
+                binaries = {
+                    'prefetch': f'{prefetch_local_bin}',
+                    'fasterq-dump': f'{fasterqdump_local_bin}'
+                }
+            else:
+                # Install the software
+                binaries = self.install_sratoolkit()
+
+        if binaries is not None:
+            save_cached_binaries(self.bin_dir, naming['key'], binaries)
+        return binaries
 
 
     def install_sratoolkit(self, version='3.1.1') -> dict[str, str]|None:
@@ -312,39 +360,43 @@ class SRA(Source):
 
         self.logger.info('Download the sratoolkit binnaries...')
 
-        cmd = f'curl -o {tarpath} {download_link}'
-        ret = subprocess.run(cmd.split(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # The archive is streamed to disk in-process and its checksum can be pinned
+        # through the SEQDD_SRATOOLKIT_SHA256 environment variable
+        downloaded = stream_download(download_link, tarpath, self.logger,
+                                     expected_sha256=environ.get('SEQDD_SRATOOLKIT_SHA256'))
 
-        if ret.returncode != 0:
+        if not downloaded:
             self.logger.error('Impossible to automatically download sratoolkit. SRA downloader has not been installed...')
             return None
 
-        # Uncompress the archive
-        cmd = f'tar -xzf {tarpath} -C {self.bin_dir}'
-        ret = subprocess.run(cmd.split(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        remove(tarpath)
-
-        if ret.returncode != 0:
+        # Uncompress the archive in-process: tarfile streams the gzip member by member
+        # without forking a tar subprocess
+        try:
+            with tarfile.open(tarpath, 'r:gz') as tf:
+                tf.extractall(self.bin_dir)
+        except (tarfile.TarError, OSError):
             self.logger.error('Impossible to expand the sratoolkit tar.gz on your system.')
             return None
+        finally:
+            remove(tarpath)
 
-        # Create links to the bins
+        # Create links to the bins. os.symlink is a single syscall, no ln subprocess needed.
         prefetch_bin = path.abspath(path.join(self.bin_dir, dirname, 'bin', 'prefetch'))
         prefetch_ln = path.abspath(path.join(self.bin_dir, 'prefetch'))
-        cmd = f'ln -s {prefetch_bin} {prefetch_ln}'
-        ret = subprocess.run(cmd.split())
-        if ret.returncode != 0:
+        try:
+            symlink(prefetch_bin, prefetch_ln)
+        except OSError:
             self.logger.error(f'Impossible to create symbolic link {prefetch_ln}. SRA downloader has not been installed...')
             return None
 
         fasterqdump_bin = path.abspath(path.join(self.bin_dir, dirname, 'bin', 'fasterq-dump'))
         fasterqdump_ln = path.abspath(path.join(self.bin_dir, 'fasterq-dump'))
-        cmd = f'ln -s {fasterqdump_bin} {fasterqdump_ln}'
-        ret = subprocess.run(cmd.split())
-        if ret.returncode != 0:
+        try:
+            symlink(fasterqdump_bin, fasterqdump_ln)
+        except OSError:
             self.logger.error(f'Impossible to create symbolic link {fasterqdump_ln}. SRA downloader has not been installed...')
             return None
-        
+
         self.logger.info(f'SRA downloader binaries installed at {self.bin_dir}')
 
         return {
@@ -33,29 +33,13 @@ class URL(Source):
         return True
 
 
-    def src_delay_ready(self) -> bool:
-        """
-        Checks if the minimum delay between URL queries has passed.
-
-        :return: True if the minimum delay has passed, False otherwise.
-        """
-        locked = self.mutex.acquire()
-        if locked:
-            ready = time.time() - self.last_query > self.min_delay
-            if ready:
-                self.last_query = time.time()
-            self.mutex.release()
-            return ready
-        return False
-
-
     def remaining_time_before_next_query(self) -> float:
         """
         Calculates the remaining time before the next URL query can be made.
 
         :return: The remaining time in seconds.
         """
-        return max(0, self.min_delay - (time.time() - self.last_query))
+        return max(0, self.min_delay - (time.monotonic() - self.last_query))
 
     
     def jobs_from_accessions(self, urls: list[str], datadir: str) -> list[CmdLineJob]:
@@ -1,8 +1,13 @@
+import atexit
+import functools
+import hashlib
+import json
 import logging
-from os import path, makedirs
-from shutil import rmtree
-import subprocess
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import access, path, makedirs, remove, replace, stat, X_OK
+from shutil import move, rmtree, which
+from urllib.request import urlopen
 
 from seqdd.utils.scheduler import JobManager
 from ..register.reg_manager import Register
@@ -72,18 +77,19 @@ class DownloadManager:
 
         # Add jobs to the JobManager in an interleaved way.
         # Doing this will allow the JobManager to start jobs from different sources in parallel.
-        idxs = {source: 0 for source in jobs}
-        total_jobs = sum([len(jobs[source]) for source in jobs])
-        while total_jobs > 0:
-            for source in jobs:
-                if idxs[source] < len(jobs[source]):
-                    manager.add_job(jobs[source][idxs[source]])
-                    idxs[source] += 1
-                    total_jobs -= 1
-
-        # Wait for all jobs to complete
+        # Exhausted sources leave the round-robin, so the queueing is linear in the number of jobs.
+        active = deque((source, iter(jobs[source])) for source in jobs if len(jobs[source]) > 0)
+        while active:
+            source, job_iter = active.popleft()
+            try:
+                manager.add_job(next(job_iter))
+                active.append((source, job_iter))
+            except StopIteration:
+                pass
+
+        # Wait for all jobs to complete. The timeout is a safety net against a missed wakeup.
         while manager.remaining_jobs() > 0:
-            time.sleep(1)
+            manager.wait_until_idle(timeout=60)
 
         # Stop and join the JobManager
         manager.stop()
@@ -93,19 +99,164 @@ class DownloadManager:
 # -------------------- Utils downloads --------------------
 
 
+cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='seqdd_cleanup')
+"""A small thread pool dedicated to directory removals, shared by the whole process."""
+atexit.register(cleanup_pool.shutdown, wait=True)
+
+
+def background_rmtree(dirpath: str) -> None:
+    """
+    Remove a directory tree from a background thread, taking the unlink storm off the
+    caller's critical path. The pool is drained at interpreter exit, so pending
+    removals still complete before the process terminates.
+
+    :param dirpath: The path of the directory tree to remove.
+    """
+    cleanup_pool.submit(rmtree, dirpath, ignore_errors=True)
+
+
+def same_filesystem(src: str, dst: str) -> bool:
+    """
+    Check if two paths live on the same filesystem.
+
+    :param src: The first path.
+    :param dst: The second path.
+    :return: True if both paths are on the same filesystem. False otherwise or on stat error.
+    """
+    try:
+        return stat(src).st_dev == stat(dst).st_dev
+    except OSError:
+        return False
+
+
+def fast_move(src: str, dst: str, same_fs: bool) -> None:
+    """
+    Move src to dst. When both sides are known to live on the same filesystem, a single
+    rename syscall replaces the stat+copy+unlink chain performed by shutil.move.
+
+    :param src: The path to move.
+    :param dst: The destination path.
+    :param same_fs: True when src and dst are on the same filesystem.
+    """
+    if same_fs:
+        try:
+            replace(src, dst)
+            return
+        except OSError:
+            # Unexpected rename failure: let shutil.move do the heavy lifting
+            pass
+    move(src, dst)
+
+
+def stream_download(url: str, dest: str, logger: logging.Logger,
+                    expected_sha256: str|None = None, chunk_size: int = 1024 * 1024) -> bool:
+    """
+    Streams a remote file to disk in-process, without a curl subprocess.
+    The file is written chunk by chunk to a temporary sibling, its sha256 is computed
+    on the fly, then it is atomically renamed to dest: no partial download is ever
+    visible at the destination path.
+
+    :param url: The URL of the file to download.
+    :param dest: The destination file path.
+    :param logger: The logger object.
+    :param expected_sha256: The expected sha256 hexdigest of the file. None to skip the check.
+    :param chunk_size: The size of the streamed chunks in bytes.
+    :return: True if the download succeeded (and the checksum matched). False otherwise.
+    """
+    tmp_dest = f'{dest}.part'
+    sha256 = hashlib.sha256()
+
+    try:
+        with urlopen(url) as response, open(tmp_dest, 'wb') as fw:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                fw.write(chunk)
+    except OSError:
+        logger.error(f'Failed to download {url}')
+        if path.exists(tmp_dest):
+            remove(tmp_dest)
+        return False
+
+    digest = sha256.hexdigest()
+    if expected_sha256 is not None and digest != expected_sha256:
+        logger.error(f'Checksum mismatch for {url}: expected {expected_sha256}, got {digest}')
+        remove(tmp_dest)
+        return False
+
+    logger.debug(f'Downloaded {url} (sha256: {digest})')
+    replace(tmp_dest, dest)
+    return True
+
+
+bin_cache_filename = '.seqdd_bin_cache.json'
+"""Name of the file caching the resolved binary paths, stored in the binary directory."""
+
+
+def load_cached_binaries(bin_dir: str, source_key: str) -> dict[str, str]|None:
+    """
+    Loads the binary paths resolved by a previous run for a source.
+    Each cached path is revalidated with a filesystem-level executability check,
+    so no subprocess is spawned. A stale path invalidates the whole record.
+
+    :param bin_dir: The binary directory path holding the cache file.
+    :param source_key: The key of the source the binaries belong to.
+    :return: The cached binary paths, or None when absent or stale.
+    """
+    cache_file = path.join(bin_dir, bin_cache_filename)
+    try:
+        with open(cache_file) as fr:
+            cache = json.load(fr)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    binaries = cache.get(source_key)
+    if binaries is None:
+        return None
+
+    # Revalidate the cached paths: they may point to removed or replaced binaries
+    if any(which(binpath) is None for binpath in binaries.values()):
+        return None
+
+    return binaries
+
+
+def save_cached_binaries(bin_dir: str, source_key: str, binaries: dict[str, str]) -> None:
+    """
+    Saves the binary paths resolved for a source, so the next runs skip the lookup.
+
+    :param bin_dir: The binary directory path holding the cache file.
+    :param source_key: The key of the source the binaries belong to.
+    :param binaries: The resolved binary paths to cache.
+    """
+    makedirs(bin_dir, exist_ok=True)
+    cache_file = path.join(bin_dir, bin_cache_filename)
+    try:
+        with open(cache_file) as fr:
+            cache = json.load(fr)
+    except (OSError, json.JSONDecodeError):
+        cache = {}
+
+    cache[source_key] = binaries
+    with open(cache_file, 'w') as fw:
+        json.dump(cache, fw, indent=2)
+
+
+@functools.lru_cache(maxsize=64)
 def check_binary(path_to_bin: str) -> bool:
     """
-    Check if the binary is present and executable
+    Check if the binary is present and executable, without spawning it:
+    an executability check on the file for explicit paths, a PATH lookup otherwise.
+    The result is cached so each binary is probed only once per run.
 
     :param: path_to_bin Path to the binary
     :return: True if the binary is present and executable. False otherwise.
     """
-    try:
-        cmd = f'{path_to_bin} --version'
-        ret = subprocess.run(cmd.split(' '), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return ret.returncode == 0
-    except FileNotFoundError:
-        return False
+    if path.isabs(path_to_bin):
+        return access(path_to_bin, X_OK) and path.isfile(path_to_bin)
+    return which(path_to_bin) is not None
     
 
 
@@ -34,6 +34,9 @@ class JobManager(Thread):
         # Boolean used to stop the thread
         self.stopped = Event()
         self.stopped.clear()
+        # Event set when no job is running or waiting anymore
+        self.idle_event = Event()
+        self.idle_event.clear()
 
     def stop(self) -> None:
         """
@@ -89,6 +92,10 @@ class JobManager(Thread):
             for job in to_remove:
                 self.waiting.remove(job)
 
+            # Notify the waiters when the queues are empty
+            if self.remaining_jobs() == 0:
+                self.idle_event.set()
+
             time.sleep(.1)
 
         # Clean the running jobs
@@ -135,6 +142,7 @@ class JobManager(Thread):
         # Queue the process
         self.waiting.append(process)
         self.processes.append(process)
+        self.idle_event.clear()
 
 
     def remaining_jobs(self) -> int:
@@ -144,6 +152,16 @@ class JobManager(Thread):
         return len(self.waiting) + len(self.running)
 
 
+    def wait_until_idle(self, timeout: float|None = None) -> bool:
+        """
+        Block until no job is running or waiting anymore.
+
+        :param timeout: The maximum time to wait in seconds. None to wait forever.
+        :return: True if the manager is idle, False if the timeout expired first.
+        """
+        return self.idle_event.wait(timeout)
+
+
     def add_jobs(self, processes: Iterable[Job]) -> None:
         """
         Add several jobs in the queue